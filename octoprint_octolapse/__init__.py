@@ -37,6 +37,7 @@ import errno
 from octoprint.server import util, app
 from octoprint.server.util.tornado import LargeResponseHandler, RequestlessExceptionLoggingMixin, CorsSupportMixin
 import sys
+import platform
 import base64
 import json
 import os
@@ -2307,6 +2308,17 @@ class OctolapsePlugin(
             logging_configurator.configure_loggers(log_file_path=self.get_log_file_path())
             logger.info("Started logging to file.")
 
+            # Pillow-SIMD is optional, but it makes text overlays much faster on x86 hosts (it needs SSE4 or AVX2).
+            # Log which build we are using, and only suggest Pillow-SIMD where it can help.
+            if render.is_pillow_simd():
+                logger.info("Pillow-SIMD %s detected.", render.get_pillow_version())
+            elif platform.machine().lower() in ("x86", "x86_64", "amd64", "i386", "i686"):
+                logger.info(
+                    "Pillow %s detected.  Install Pillow-SIMD for faster text overlays.", render.get_pillow_version()
+                )
+            else:
+                logger.info("Pillow %s detected.", render.get_pillow_version())
+
             # load settings
             self.load_settings()
 
@@ -3473,7 +3485,7 @@ class OctolapsePlugin(
             "camera_profile": camera_profile,
             "temporary_directory": temporary_folder
         }
-        self._rendering_task_queue.put(parameters)
+        self._rendering_processor.enqueue_task(parameters)
 
     def delete_rendering_job(self, job_guid, camera_guid):
         logger.info("Deleting unfinished rendering job.  JobGuid: %s, CameraGuid: %s", job_guid, camera_guid)
@@ -3483,7 +3495,7 @@ class OctolapsePlugin(
             "action": "remove_unfinished",
             "delete": True
         }
-        self._rendering_task_queue.put(parameters)
+        self._rendering_processor.enqueue_task(parameters)
 
     def on_render_start(self, payload, job):
         """Called when a timelapse has started being rendered.  Calls any callbacks OnRenderStart callback set in the
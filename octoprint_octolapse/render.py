@@ -23,20 +23,26 @@
 from __future__ import unicode_literals
 import re
 import math
+import string
 import os
 import sys
+import shutil
 import threading
+import subprocess
+from collections import deque
+import multiprocessing
+from multiprocessing.pool import ThreadPool
 from six.moves import queue
-from six import string_types, iteritems
+from six import iteritems
 import time
 import json
 import copy
 import zipfile as zipfile
-from csv import DictReader
-# sarge was added to the additional requirements for the plugin
+import csv
 import datetime
-from tempfile import mkdtemp
 import uuid
+from io import BytesIO
+import PIL
 from PIL import Image, ImageDraw, ImageFont
 
 import octoprint_octolapse.utility as utility
@@ -50,6 +56,141 @@ logging_configurator = LoggingConfigurator()
 logger = logging_configurator.get_logger(__name__)
 
 
+def get_pillow_version():
+    # Pillow < 5.2 used PILLOW_VERSION
+    return getattr(PIL, "__version__", getattr(PIL, "PILLOW_VERSION", "UNKNOWN"))
+
+
+def is_pillow_simd():
+    """Returns true if the Pillow-SIMD fork is installed.  Pillow-SIMD versions end with .postN"""
+    return "post" in get_pillow_version()
+
+
+# Loaded overlay fonts, keyed by (font_path, font_size).  Loading a font parses the font file and builds a new
+# FreeType face, so reuse them across frames and renderings.  Fonts are read-only once loaded.
+_overlay_font_cache = {}
+_overlay_font_cache_lock = threading.Lock()
+_overlay_font_cache_max_size = 8
+
+
+def get_overlay_font(font_path, font_size):
+    """Returns a (cached) truetype font for the given path and size.  Raises IOError if the font cannot be loaded."""
+    key = (font_path, font_size)
+    with _overlay_font_cache_lock:
+        font = _overlay_font_cache.get(key, None)
+        if font is None:
+            font = ImageFont.truetype(font_path, size=font_size)
+            if len(_overlay_font_cache) >= _overlay_font_cache_max_size:
+                _overlay_font_cache.clear()
+            _overlay_font_cache[key] = font
+        return font
+
+
+# Rasterized overlay text, keyed by the text and everything that affects how it is drawn.  Most templates produce
+# the same text for many frames in a row (the current layer or height for example), so the glyphs only need to be
+# rendered the first time.  The cached layers are never modified.
+_overlay_text_layer_cache = {}
+_overlay_text_layer_cache_lock = threading.Lock()
+_overlay_text_layer_cache_max_size = 32
+
+
+def get_overlay_text_layer(text, font_path, font_size, alignment, text_color, outline_color, outline_width):
+    """Returns a (cached) tuple of (layer, text_size, offset).  layer is an RGBA image cropped to the drawn text, or
+    None if nothing is drawn.  offset is the position of the layer relative to the point the text is drawn at, and
+    text_size is the size used to align the text within the frame."""
+    key = (text, font_path, font_size, alignment, text_color, outline_color, outline_width)
+    with _overlay_text_layer_cache_lock:
+        text_layer = _overlay_text_layer_cache.get(key, None)
+    if text_layer is not None:
+        return text_layer
+
+    font = get_overlay_font(font_path, font_size)
+    measure = ImageDraw.Draw(Image.new('RGBA', (1, 1)))
+    text_size = measure.multiline_textsize(text, font=font, spacing=0)
+    layer_width, layer_height = measure.multiline_textsize(text, font=font, stroke_width=outline_width)
+    # The outline and some glyphs (descenders, italics) extend past the measured size, so leave room on every side.
+    padding = outline_width + font_size // 4
+    layer = Image.new('RGBA', (layer_width + padding * 2, layer_height + padding * 2), (255, 255, 255, 0))
+    ImageDraw.Draw(layer).multiline_text(
+        xy=(padding, padding),
+        text=text,
+        fill=text_color,
+        font=font,
+        align=alignment,
+        stroke_width=outline_width,
+        stroke_fill=outline_color
+    )
+    # Only keep the pixels that were drawn on so that as little as possible of each frame gets blended.
+    bbox = layer.getchannel('A').getbbox()
+    if bbox is None:
+        text_layer = (None, text_size, (0, 0))
+    else:
+        text_layer = (layer.crop(bbox), text_size, (bbox[0] - padding, bbox[1] - padding))
+    with _overlay_text_layer_cache_lock:
+        if len(_overlay_text_layer_cache) >= _overlay_text_layer_cache_max_size:
+            _overlay_text_layer_cache.clear()
+        _overlay_text_layer_cache[key] = text_layer
+    return text_layer
+
+
+def blend_text_layer(image, text_layer, offset, x, y, in_place=False):
+    """Returns a copy of an RGB image with a text layer from get_overlay_text_layer drawn at (x, y).  Only the region
+    covered by the layer is blended, and paste clips it to the image, so text that runs past the edges is handled.
+    If in_place is True the layer is drawn onto the image itself, which saves copying the whole image."""
+    if text_layer is None:
+        # nothing to draw
+        return image
+    left = int(round(x)) + offset[0]
+    top = int(round(y)) + offset[1]
+    if not in_place:
+        image = image.copy()
+    # Pasting with the layer as its own mask blends it using its alpha channel, which is the same as alpha
+    # compositing onto an opaque image, but without converting the image to RGBA and back.
+    image.paste(text_layer, (left, top), text_layer)
+    return image
+
+
+# The encoders supported by each ffmpeg executable, keyed by the ffmpeg path.  Probing runs ffmpeg, so only do it
+# once.
+_ffmpeg_encoders_cache = {}
+_ffmpeg_encoders_cache_lock = threading.Lock()
+
+
+def get_ffmpeg_encoders(ffmpeg_path):
+    """Returns a (cached) set of the names of the encoders that ffmpeg reports, or an empty set if ffmpeg could not
+    be run.  Note that this does not mean the hardware for an encoder is available."""
+    with _ffmpeg_encoders_cache_lock:
+        encoders = _ffmpeg_encoders_cache.get(ffmpeg_path, None)
+        if encoders is None:
+            encoders = set()
+            try:
+                proc = subprocess.Popen(
+                    [ffmpeg_path, '-hide_banner', '-encoders'],
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                    universal_newlines=True
+                )
+                stdout, stderr = proc.communicate()
+                # The encoders are listed after a ' ------' separator, one per line:  ' V..... libx264  description'
+                listing = False
+                for line in stdout.splitlines():
+                    if not listing:
+                        listing = line.strip().startswith('------')
+                        continue
+                    parts = line.split()
+                    if len(parts) > 1:
+                        encoders.add(parts[1])
+            except (OSError, IOError):
+                logger.exception("Unable to read the available encoders from ffmpeg at %s.", ffmpeg_path)
+            _ffmpeg_encoders_cache[ffmpeg_path] = encoders
+        return encoders
+
+
+# Matches file names that are valid on every supported OS.  The characters are the ones windows rejects, which is a
+# superset of the characters rejected elsewhere.
+_valid_rendering_filename_regex = re.compile(r'^[^\x00-\x1f<>:"/\\|?*]+\Z')
+
+
 def is_rendering_template_valid(template, options):
     # make sure we have all the replacements we need
     option_dict = {}
@@ -64,17 +205,9 @@ def is_rendering_template_valid(template, options):
     except ValueError:
         return False, "A value error occurred when replacing the provided tokens."
 
-    temp_directory = mkdtemp()
-    file_path = "{0}{1}.{2}".format(temp_directory, filename, "mp4")
     # see if the filename is valid
-    if not os.access(file_path, os.W_OK):
-        try:
-            open(file_path, 'w').close()
-            os.unlink(file_path)
-        except (IOError, OSError):
-            return False, "The resulting filename is not a valid filename.  Most likely an invalid character was used."
-
-    utility.rmtree(temp_directory)
+    if not _valid_rendering_filename_regex.match(filename):
+        return False, "The resulting filename is not a valid filename.  Most likely an invalid character was used."
 
     return True, ""
 
@@ -105,28 +238,26 @@ def preview_overlay(rendering_profile, image=None):
     overlay_outline_color = rendering_profile.get_overlay_outline_color()
     overlay_outline_width = rendering_profile.overlay_outline_width
     if image is None:
-        image_color = (0, 0, 0, 255)
-        if isinstance(overlay_text_color, list):
-            image_color = tuple(255 - c for c in overlay_text_color)
-        # Create an image with background color inverse to the text color.
+        # Create an image with background color inverse to the text color (ignoring alpha).
+        image_color = tuple(255 - c for c in overlay_text_color[:3])
         image = Image.new('RGB', (640, 480), color=image_color)
 
     try:
-        font = ImageFont.truetype(rendering_profile.overlay_font_path, size=50)
+        font = get_overlay_font(rendering_profile.overlay_font_path, 50)
     except IOError as e:
         logger.exception("An error occurred while opening the selected font")
         raise e
 
     def draw_center(i, t, overlay_text_color, dx=0, dy=0):
-        """Draws the text centered in the image, offsets by (dx, dy)."""
-        text_image = Image.new('RGBA', i.size, (255, 255, 255, 0))
-        d = ImageDraw.Draw(text_image)
-        iw, ih = i.size
+        """Draws opaque text centered in the image, offsets by (dx, dy).  There is nothing to blend, so the text is
+        drawn directly onto an RGB copy of the image."""
+        output_image = i.convert('RGB')
+        d = ImageDraw.Draw(output_image)
+        iw, ih = output_image.size
         tw, th = d.textsize(t, font=font)
-
         d.text(xy=(iw / 2 - tw / 2 + dx, ih / 2 - th / 2 + dy), text=t,
-               fill=tuple(overlay_text_color), font=font)
-        return Image.alpha_composite(i.convert('RGBA'), text_image).convert('RGB')
+               fill=tuple(overlay_text_color[:3]), font=font)
+        return output_image
 
     # copy the overlay text color list
     image_text_color = list(overlay_text_color)
@@ -156,7 +287,7 @@ def preview_overlay(rendering_profile, image=None):
                                            format_vars=format_vars,
                                            font_path=rendering_profile.overlay_font_path,
                                            font_size=rendering_profile.overlay_font_size,
-                                           overlay_location=rendering_profile.overlay_text_pos,
+                                           overlay_location=rendering_profile.get_overlay_text_pos(),
                                            overlay_text_alignment=rendering_profile.overlay_text_alignment,
                                            overlay_text_valign=rendering_profile.overlay_text_valign,
                                            overlay_text_halign=rendering_profile.overlay_text_halign,
@@ -213,9 +344,6 @@ class RenderJobInfo(object):
                 timelapse_job_info.PrintFileName, utility.SnapshotNumberFormat
             )
         )
-        self.pre_roll_snapshot_filename_format = utility.get_pre_roll_snapshot_filename(
-            timelapse_job_info.PrintFileName, utility.SnapshotNumberFormat
-        )
         # rendering directory path
         self.output_tokens = self._get_output_tokens(self.temporary_directory)
         self.rendering_output_format = rendering_profile.output_format
@@ -237,14 +365,6 @@ class RenderJobInfo(object):
         # store any rendering errors
         self.rendering_error = None
 
-    def get_snapshot_name_from_index(self, index):
-        return utility.get_snapshot_filename(
-            self.timelapse_job_info.PrintFileName, index
-        )
-
-    def get_snapshot_full_path_from_index(self, index):
-        return os.path.join(self.snapshot_directory, self.get_snapshot_name_from_index(index))
-
     def _get_output_tokens(self, data_directory):
         job_info = self.timelapse_job_info
         assert (isinstance(job_info, utility.TimelapseJobInfo))
@@ -274,6 +394,21 @@ class RenderJobInfo(object):
                    "vob": "mpeg2video"}
         return VCODECS.get(output_format.lower(), "mpeg2video")
 
+    # Hardware encoders that can replace the software encoder of an output format, in order of preference.  All of
+    # them work without any additional device setup.
+    HARDWARE_VCODECS = {
+        "h264": ["h264_nvenc", "h264_v4l2m2m", "h264_omx"],
+        "h265": ["hevc_nvenc", "hevc_v4l2m2m"],
+    }
+
+    @staticmethod
+    def get_hardware_vcodec(output_format, available_encoders):
+        """Returns the preferred hardware encoder for the output format, or None if there is none available."""
+        for v_codec in RenderJobInfo.HARDWARE_VCODECS.get(output_format.lower(), []):
+            if v_codec in available_encoders:
+                return v_codec
+        return None
+
     @staticmethod
     def get_extension_from_output_format(output_format):
         EXTENSIONS = {"avi": "avi",
@@ -307,27 +442,20 @@ class RenderJobInfo(object):
         camera_name=None
     ):
         tokens = {}
-        print_end_time_string = (
-            "UNKNOWN" if print_end_time is None
-            else time.strftime("%Y%m%d%H%M%S", time.localtime(print_end_time))
-        )
-        tokens["PRINTENDTIME"] = print_end_time_string
-        print_end_timestamp = (
-            "UNKNOWN" if print_end_time is None
-            else "{0:d}".format(math.trunc(round(print_end_time, 2) * 100))
-        )
-        tokens["PRINTENDTIMESTAMP"] = print_end_timestamp
-        print_start_time_string = (
-            "UNKNOWN" if print_start_time is None
-            else time.strftime("%Y%m%d%H%M%S", time.localtime(print_start_time))
-        )
-        tokens["PRINTSTARTTIME"] = print_start_time_string
-        print_start_timestamp = {
-            "UNKNOWN" if print_start_time is None
-            else "{0:d}".format(math.trunc(round(print_start_time, 2) * 100))
-        }
-        tokens["PRINTSTARTTIMESTAMP"] = print_start_timestamp
-        tokens["DATETIMESTAMP"] = "{0:d}".format(math.trunc(round(time.time(), 2) * 100))
+        # timestamps are in hundredths of a second, rounded to the nearest hundredth.
+        if print_end_time is None:
+            tokens["PRINTENDTIME"] = "UNKNOWN"
+            tokens["PRINTENDTIMESTAMP"] = "UNKNOWN"
+        else:
+            tokens["PRINTENDTIME"] = time.strftime("%Y%m%d%H%M%S", time.localtime(print_end_time))
+            tokens["PRINTENDTIMESTAMP"] = "{0:d}".format(int(print_end_time * 100 + 0.5))
+        if print_start_time is None:
+            tokens["PRINTSTARTTIME"] = "UNKNOWN"
+            tokens["PRINTSTARTTIMESTAMP"] = "UNKNOWN"
+        else:
+            tokens["PRINTSTARTTIME"] = time.strftime("%Y%m%d%H%M%S", time.localtime(print_start_time))
+            tokens["PRINTSTARTTIMESTAMP"] = "{0:d}".format(int(print_start_time * 100 + 0.5))
+        tokens["DATETIMESTAMP"] = "{0:d}".format(int(time.time() * 100 + 0.5))
         print_failed = print_end_state not in ["COMPLETED", "UNKNOWN"]
         failed_flag = "FAILED" if print_failed else ""
         tokens["FAILEDFLAG"] = failed_flag
@@ -391,6 +519,9 @@ class RenderingProcessor(threading.Thread):
         self.r_lock = threading.RLock()
         self.temp_files_lock = threading.RLock()
         self.rendering_task_queue = rendering_task_queue
+        # the number of tasks added with enqueue_task that have not finished processing.  Unlike qsize, this includes
+        # the task currently being processed.
+        self._pending_task_count = 0
         # make a local copy of everything.
         self.data_directory = data_directory
         self._on_start_callback = on_start
@@ -417,9 +548,15 @@ class RenderingProcessor(threading.Thread):
         self.update_directories()
         self._last_progress_time_update = 0
 
+    def enqueue_task(self, parameters):
+        """Adds a task to the rendering task queue."""
+        with self.r_lock:
+            self._pending_task_count += 1
+        self.rendering_task_queue.put(parameters)
+
     def is_processing(self):
         with self.r_lock:
-            return self._has_pending_jobs() or self.rendering_task_queue.qsize() > 0
+            return self._has_pending_jobs() or self._pending_task_count > 0
 
     def get_failed(self):
         with self.r_lock:
@@ -704,7 +841,7 @@ class RenderingProcessor(threading.Thread):
                     "camera_profile": None,
                     "temporary_directory": temporary_directory
                 }
-                self.rendering_task_queue.put(parameters)
+                self.enqueue_task(parameters)
 
         if has_created_jobs:
             return {
@@ -1060,36 +1197,40 @@ class RenderingProcessor(threading.Thread):
             try:
                 # see if there are any rendering tasks.
                 rendering_task_info = self.rendering_task_queue.get(True, self._idle_sleep_seconds)
-                if rendering_task_info:
-
-                    action = rendering_task_info["action"]
-                    if action == "add":
-                        # add the job to the queue if it is not already
-                        self._add_job(
-                            rendering_task_info["job_guid"],
-                            rendering_task_info["camera_guid"],
-                            rendering_task_info["rendering_profile"],
-                            rendering_task_info["camera_profile"],
-                            rendering_task_info["temporary_directory"],
-                        )
-                    elif action == "remove_unfinished":
-                        # add the job to the queue if it is not already
-                        self._remove_unfinished_job(
-                            rendering_task_info["job_guid"],
-                            rendering_task_info["camera_guid"],
-                            delete=rendering_task_info.get("delete", False),
-                        )
-                    elif action == "import":
-                        self._add_unfinished_job(
-                            rendering_task_info["job_guid"],
-                            rendering_task_info["camera_guid"],
-                            rendering_task_info["rendering_profile"],
-                            rendering_task_info["camera_profile"],
-                            rendering_task_info["temporary_directory"]
-                        )
-                    # go ahead and signal that the task queue is finished.  We are using another method
-                    # to determine if all rendering jobs are completed.
-                self.rendering_task_queue.task_done()
+                try:
+                    if rendering_task_info:
+
+                        action = rendering_task_info["action"]
+                        if action == "add":
+                            # add the job to the queue if it is not already
+                            self._add_job(
+                                rendering_task_info["job_guid"],
+                                rendering_task_info["camera_guid"],
+                                rendering_task_info["rendering_profile"],
+                                rendering_task_info["camera_profile"],
+                                rendering_task_info["temporary_directory"],
+                            )
+                        elif action == "remove_unfinished":
+                            # add the job to the queue if it is not already
+                            self._remove_unfinished_job(
+                                rendering_task_info["job_guid"],
+                                rendering_task_info["camera_guid"],
+                                delete=rendering_task_info.get("delete", False),
+                            )
+                        elif action == "import":
+                            self._add_unfinished_job(
+                                rendering_task_info["job_guid"],
+                                rendering_task_info["camera_guid"],
+                                rendering_task_info["rendering_profile"],
+                                rendering_task_info["camera_profile"],
+                                rendering_task_info["temporary_directory"]
+                            )
+                        # go ahead and signal that the task queue is finished.  We are using another method
+                        # to determine if all rendering jobs are completed.
+                finally:
+                    with self.r_lock:
+                        self._pending_task_count -= 1
+                    self.rendering_task_queue.task_done()
             except queue.Empty:
                 pass
             except Exception as e:
@@ -1418,6 +1559,31 @@ class TimelapseRenderJob(threading.Thread):
     # ffmpeg progress regexes
     _ffmpeg_duration_regex = re.compile(r"Duration: (\d{2}):(\d{2}):(\d{2})\.\d{2}")
     _ffmpeg_current_regex = re.compile(r"time=(\d{2}):(\d{2}):(\d{2})\.\d{2}")
+    # the maximum number of prepared frames waiting to be sent to ffmpeg
+    _frame_queue_size = 64
+    # how many frames ahead of the current frame to start reading from disk
+    _frame_prefetch_distance = 4
+    # the column of each field within a snapshot metadata row
+    _metadata_field_indexes = dict(
+        (field, index) for index, field in enumerate(SnapshotMetadata.METADATA_FIELDS)
+    )
+    # the number of trailing ffmpeg output lines to keep for error reporting
+    _ffmpeg_output_line_count = 256
+    # the subdirectory of the temporary rendering directory that receives the rendered frames for the after render
+    # script
+    _after_render_frames_subdirectory = "after_render_frames"
+    # numeric overlay variables as (name, conversion from the metadata value, format)
+    _overlay_number_fields = [
+        ("layer", int, "{0}"),
+        ("height", float, "{0}"),
+        ("x", float, "{0:.3f}"),
+        ("y", float, "{0:.3f}"),
+        ("z", float, "{0:.3f}"),
+        ("e", float, "{0:.5f}"),
+        ("f", lambda value: int(float(value)), "{0}"),
+        ("x_snapshot", float, "{0:.3f}"),
+        ("y_snapshot", float, "{0:.3f}"),
+    ]
 
     def __init__(
         self,
@@ -1436,10 +1602,28 @@ class TimelapseRenderJob(threading.Thread):
         self._on_start_event = on_start_event
         self._fps = None
         self._snapshot_metadata = None
+        # the names of the images in the temporary rendering directory, in rendering order
+        self._frame_file_names = []
         self._image_count = 0
         self._image_count = 0
         self._max_image_number = 0
         self._images_removed_count = 0
+        self._pre_roll_frames = 0
+        # text overlay settings, see _prepare_text_overlays
+        self._add_overlays = False
+        self._overlay_first_timestamp = None
+        # the snapshot metadata rows, keyed by the snapshot file name
+        self._overlay_metadata = {}
+        # the names of the variables used by the overlay text template
+        self._overlay_template_fields = set()
+        self._overlay_location = None
+        self._overlay_text_color = None
+        self._overlay_outline_color = None
+        # any error that occurred while preparing the frames for ffmpeg
+        self._frame_error = None
+        # where the rendered frames are written for the after render script, or None, see _prepare_after_render_frames
+        self._after_render_frames_dir = None
+        self._post_roll_frames = 0
         self._threads = render_job_info.rendering.thread_count
         self._ffmpeg = render_job_info.ffmpeg_directory
         if self._ffmpeg is not None:
@@ -1553,37 +1737,28 @@ class TimelapseRenderJob(threading.Thread):
                         watermark_path = watermark_path.replace(
                             "\\", "/").replace(":", "\\\\:")
 
-                # Do image preprocessing.  This relies on the original file name, so no renaming before running
-                # this function
-                self._add_text_overlays()
+                # Make sure we can add the text overlays.  They are added while the frames are sent to ffmpeg.
+                self._prepare_text_overlays()
 
-                # rename the images
-                logger.debug("Renaming images.")
-                self._rename_images()
+                # put the images in rendering order
+                self._sort_frames()
 
                 # Add pre and post roll.
                 self._apply_pre_post_roll()
 
-                # prepare ffmpeg command
-                command_args = self._create_ffmpeg_command_args(
-                    os.path.join(self._temp_rendering_dir, self._render_job_info.snapshot_filename_format),
-                    temp_filepath,
-                    watermark=watermark_path
-                )
+                # Keep a copy of the rendered frames if an after render script needs them.
+                self._prepare_after_render_frames()
 
                 # Render the timelapse via ffmpeg/avconv
-                logger.info("Running ffmpeg.")
                 with self.render_job_lock:
-                    try:
-                        # create an async thread, along with a callback for processing ffmpeg debug output
-                        # for calculating progress
-                        p = script.POpenWithTimeoutAsync(on_stderr_line_received=self._process_ffmpeg_output)
-                        p.run(command_args)
-                    except Exception as e:
-                        logger.exception("An exception occurred while running the ffmpeg process.")
-                        raise RenderError('rendering-exception', "ffmpeg failed during rendering of movie. "
-                                                                 "Please check plugin_octolapse.log for details.",
-                                          cause=e)
+                    p = self._render_movie(temp_filepath, watermark_path)
+                    if self._frame_error is not None:
+                        if isinstance(self._frame_error, RenderError):
+                            raise self._frame_error
+                        raise RenderError('rendering-exception', "An error occurred while preparing frames for "
+                                                                 "ffmpeg.  Please check plugin_octolapse.log for "
+                                                                 "details.",
+                                          cause=self._frame_error)
                     if p.return_code != 0:
                         return_code = p.return_code
                         stderr_text = "\n".join(p.stderr_lines)
@@ -1633,8 +1808,19 @@ class TimelapseRenderJob(threading.Thread):
         finally:
             # Start cleanup of rendering/snapshot files
 
+            # Delete the temporary rendering directory, including the temp rendering file if it exists, in the
+            # background.  It is renamed first, so the next rendering can't conflict with it.
+            temporary_files_deleted = False
+            if os.path.isdir(self._temp_rendering_dir):
+                try:
+                    utility.rmtree_in_background(self._temp_rendering_dir)
+                    temporary_files_deleted = True
+                except (OSError, IOError):
+                    logger.exception(
+                        "Could not rename the temporary rendering directory, deleting the files one by one."
+                    )
             # delete the temp rendering file if it exists.
-            if os.path.isfile(temp_filepath):
+            if not temporary_files_deleted and os.path.isfile(temp_filepath):
                 try:
                     utility.remove(temp_filepath)
                 except (OSError, IOError):
@@ -1650,7 +1836,7 @@ class TimelapseRenderJob(threading.Thread):
                         self._render_job_info.job_guid,
                         self._render_job_info.camera_guid,
                     )
-                    # we will also be deleting temporary files.  Get a total count so we can report total progress
+                    # we may also be deleting temporary files.  Get a total count so we can report total progress
                     cleanup_total_steps = num_snapshots + self._get_num_temporary_files()
 
                     # delete all snapshots for the current render job, making sure to report total cleanup progress
@@ -1667,21 +1853,24 @@ class TimelapseRenderJob(threading.Thread):
                 except (IOError, OSError) as e:
                     raise e
 
-            try:
-                if cleanup_total_steps is None:
-                    # if we didn't delete the snapshots due to failure or some other reason, we won't
-                    # have any cleanup steps at this point.  Get the number of temp files so we can report progress.
-                    cleanup_total_steps = self._get_num_temporary_files()
-                # delete all temporary rendering files and report cleanup progress
-                self._clear_temporary_files(
-                    progress_key="cleanup",
-                    progress_current_step=cleanup_current_step,
-                    progress_total_steps=cleanup_total_steps
-                )
-            except (OSError, IOError):
-                # It's not a huge deal if we can't clean the temporary files at the moment.  Log the error and move on.
-                logger.exception("Could not clean temporary rendering files.")
-                pass
+            if not temporary_files_deleted:
+                try:
+                    if cleanup_total_steps is None:
+                        # if we didn't delete the snapshots due to failure or some other reason, we won't
+                        # have any cleanup steps at this point.  Get the number of temp files so we can report
+                        # progress.
+                        cleanup_total_steps = self._get_num_temporary_files()
+                    # delete all temporary rendering files and report cleanup progress
+                    self._clear_temporary_files(
+                        progress_key="cleanup",
+                        progress_current_step=cleanup_current_step,
+                        progress_total_steps=cleanup_total_steps
+                    )
+                except (OSError, IOError):
+                    # It's not a huge deal if we can't clean the temporary files at the moment.  Log the error and
+                    # move on.
+                    logger.exception("Could not clean temporary rendering files.")
+                    pass
 
         if r_error is None:
             # Success!
@@ -1733,10 +1922,14 @@ class TimelapseRenderJob(threading.Thread):
         # loop through each file in the snapshot directory
         snapshot_files = []
         for name in os.listdir(self._render_job_info.snapshot_directory):
+            # skip hidden files and non jpgs by name first so that only possible snapshots need a stat call
+            if name.startswith('.') or not utility.is_valid_snapshot_extension(
+                utility.get_extension_from_filename(name)
+            ):
+                continue
             path = os.path.join(self._render_job_info.snapshot_directory, name)
-            # skip non-files and non jpgs
-            extension = utility.get_extension_from_full_path(path)
-            if not os.path.isfile(path) or not utility.is_valid_snapshot_extension(extension):
+            # skip non-files
+            if not os.path.isfile(path):
                 continue
             snapshot_files.append(path)
 
@@ -1764,7 +1957,9 @@ class TimelapseRenderJob(threading.Thread):
                 file_name = os.path.basename(file_path)
                 target = os.path.join(target_folder, file_name)
                 with Image.open(file_path) as img:
-                    if img.format not in ["JPEG", "JPEG 2000"]:
+                    # frames are streamed to ffmpeg's mjpeg decoder, so everything else (including jpeg 2000)
+                    # must be converted
+                    if img.format != "JPEG":
                         logger.info(
                             "The image at %s is in %s format.  Attempting to convert to jpeg.",
                             file_path,
@@ -1818,10 +2013,8 @@ class TimelapseRenderJob(threading.Thread):
 
         try:
             with open(metadata_path, 'r') as metadata_file:
-                # read the metadaata and convert it to a dict
-                dictreader = DictReader(metadata_file, SnapshotMetadata.METADATA_FIELDS)
-                # convert the dict to a list
-                self._snapshot_metadata = list(dictreader)
+                # read the metadata rows, skipping blank lines.  Fields are looked up with _get_metadata_value.
+                self._snapshot_metadata = [row for row in csv.reader(metadata_file) if row]
                 return
         except IOError as e:
             logger.exception("No metadata exists, skipping metadata processing.")
@@ -1847,10 +2040,7 @@ class TimelapseRenderJob(threading.Thread):
         script_path = self._render_job_info.camera.on_before_render_script.strip()
         if not script_path:
             return
-        self.on_render_progress('pre_render_script')
-
         # Todo:  add the original snapshot directory and template path
-        logger.debug("Executing the pre-rendering script.")
         cmd = script.CameraScriptBeforeRender(
             script_path,
             self._render_job_info.camera.name,
@@ -1861,14 +2051,9 @@ class TimelapseRenderJob(threading.Thread):
                 self._render_job_info.snapshot_filename_format
             )
         )
-        cmd.run()
-        if not cmd.success():
-            self._before_render_error = RenderError(
-                'before_render_script_error',
-                "A script occurred while executing executing the before-render script.  Check "
-                "plugin_octolapse.log for details. "
-            )
-            return
+        self._before_render_error = self._run_render_script(
+            cmd, 'pre_render_script', 'before_render_script_error', 'before-render'
+        )
         # adjust the number of images in the temp rendering directory, this number may have changed
         # self._image_count = self._count_snapshot_files(self._temp_rendering_dir)
 
@@ -1924,93 +2109,145 @@ class TimelapseRenderJob(threading.Thread):
                                                    "Please check the rendering settings for Min and Max FPS "
                                                    "as well as the number of snapshots captured.")
 
-    def _add_text_overlays(self):
-        """Adds any text overlays configured within the rendering settings to every timelapse image."""
+    def _prepare_text_overlays(self):
+        """Makes sure that the text overlays configured within the rendering settings can be added, and reads the
+           settings that are shared by every frame.  The overlays are added while the frames are streamed to ffmpeg.
+        """
+        self._add_overlays = False
         if not self._render_job_info.rendering.overlay_text_template:
             return
 
         if not os.path.isfile(self._render_job_info.rendering.overlay_font_path):
             raise RenderError("overlay-font", "The rendering overlay font path does not exist.  Check your rendering settings and select a different font.")
 
-        if self._snapshot_metadata is None:
+        if not self._snapshot_metadata:
             logger.warning("No snapshot metadata was found, cannot add text overlays images.")
             return
 
-        logger.info("Started adding text overlays.")
-        first_timestamp = float(self._snapshot_metadata[0]['time_taken'])
-        num_images = len(self._snapshot_metadata)
-        for index, data in enumerate(self._snapshot_metadata):
-            self.on_render_progress('adding_overlays', index, num_images)
-            # TODO:  MAKE SURE THIS WORKS IF THERE ARE ANY ERRORS
-            # Variables the user can use in overlay_text_template.format().
-            format_vars = utility.SafeDict()
-
-            # Extra metadata according to SnapshotMetadata.METADATA_FIELDS.
-            format_vars['snapshot_number'] = snapshot_number = int(data['snapshot_number']) + 1
-            format_vars['file_name'] = data['file_name']
-            format_vars['time_taken_s'] = time_taken = float(data['time_taken'])
-
-            layer = None if "layer" not in data or data["layer"] is None or data["layer"] == "None" else int(data["layer"])
-            height = None if "height" not in data or data["height"] is None or data["height"] == "None" else float(data["height"])
-            x = None if "x" not in data or data["x"] is None or data["x"] == "None" else float(data["x"])
-            y = None if "y" not in data or data["y"] is None or data["y"] == "None" else float(data["y"])
-            z = None if "z" not in data or data["z"] is None or data["z"] == "None" else float(data["z"])
-            e = None if "e" not in data or data["e"] is None or data["e"] == "None" else float(data["e"])
-            f = None if "f" not in data or data["f"] is None or data["f"] == "None" else int(float(data["f"]))
-            x_snapshot = None if "x_snapshot" not in data or data["x_snapshot"] is None or data["x_snapshot"] == "None" else float(data["x_snapshot"])
-            y_snapshot = None if "y_snapshot" not in data or data["y_snapshot"] is None or data["y_snapshot"] == "None" else float(data["y_snapshot"])
-
-            format_vars['layer'] = "None" if layer is None else "{0}".format(layer)
-            format_vars['height'] = "None" if height is None else "{0}".format(height)
-            format_vars['x'] = "None" if x is None else "{0:.3f}".format(x)
-            format_vars['y'] = "None" if y is None else "{0:.3f}".format(y)
-            format_vars['z'] = "None" if z is None else "{0:.3f}".format(z)
-            format_vars['e'] = "None" if e is None else "{0:.5f}".format(e)
-            format_vars['f'] = "None" if f is None else "{0}".format(f)
-            format_vars['x_snapshot'] = "None" if x_snapshot is None else "{0:.3f}".format(x_snapshot)
-            format_vars['y_snapshot'] = "None" if y_snapshot is None else "{0:.3f}".format(y_snapshot)
-
-            # Verify that the file actually exists.
-            file_path = os.path.join(
-                self._temp_rendering_dir,
-                self._render_job_info.get_snapshot_name_from_index(index)
+        # Parse the template once to find the variables that it uses, so that only those are calculated per frame.
+        try:
+            self._overlay_template_fields = set(
+                re.split(r'[.\[]', field_name, 1)[0]
+                for _, field_name, _, _ in string.Formatter().parse(
+                    self._render_job_info.rendering.overlay_text_template
+                )
+                if field_name
             )
-            if os.path.exists(file_path):
-                # Calculate time elapsed since the beginning of the print.
-                format_vars['current_time'] = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(time_taken))
-                format_vars['time_elapsed'] = "{}".format(
-                    datetime.timedelta(seconds=round(time_taken - first_timestamp))
+        except ValueError as e:
+            raise RenderError("overlay-text-template", "The rendering overlay text template is invalid.  Check your "
+                                                       "rendering settings.", cause=e)
+
+        self._add_overlays = True
+        self._overlay_first_timestamp = float(self._get_metadata_value(self._snapshot_metadata[0], 'time_taken'))
+        # There is a metadata row for every snapshot that was taken, even if the image was never saved or could not
+        # be converted, so the rows must be matched to the frames by file name rather than by position.
+        self._overlay_metadata = dict(
+            (self._get_metadata_value(row, 'file_name'), row) for row in self._snapshot_metadata
+        )
+        # The overlay settings are the same for every frame, so only parse and check them once.
+        rendering = self._render_job_info.rendering
+        if rendering.overlay_text_valign not in ('top', 'middle', 'bottom'):
+            raise RenderError('overlay-text-valign', "An invalid overlay text valign ({0}) was specified.".format(
+                rendering.overlay_text_valign))
+        if rendering.overlay_text_halign not in ('left', 'center', 'right'):
+            raise RenderError('overlay-text-halign', "An invalid overlay text halign ({0}) was specified.".format(
+                rendering.overlay_text_halign))
+        self._overlay_location = rendering.get_overlay_text_pos()
+        self._overlay_text_color = tuple(rendering.get_overlay_text_color())
+        self._overlay_outline_color = tuple(rendering.get_overlay_outline_color())
+
+    def _get_frame(self, index):
+        """Returns the jpeg encoded frame with the given index, adding the text overlay if necessary.  This is called
+           from multiple threads, so it must not modify any shared state."""
+        self._prefetch_frame(index + self._frame_prefetch_distance)
+        file_name = self._frame_file_names[index]
+        file_path = os.path.join(self._temp_rendering_dir, file_name)
+        if self._add_overlays:
+            data = self._overlay_metadata.get(file_name, None)
+            if data is not None:
+                return self._get_overlay_frame(file_path, data)
+            logger.error("No snapshot metadata was found for %s.  Skipping the text overlay.", file_name)
+        with open(file_path, 'rb') as frame_file:
+            return frame_file.read()
+
+    def _prefetch_frame(self, index):
+        """Asks the OS to start reading the frame with the given index into the page cache, so reading it does not
+           have to wait for the disk.  Only supported where os.posix_fadvise exists (python 3 on linux)."""
+        if not hasattr(os, 'posix_fadvise') or index >= len(self._frame_file_names):
+            return
+        try:
+            fd = os.open(os.path.join(self._temp_rendering_dir, self._frame_file_names[index]), os.O_RDONLY)
+            try:
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+            finally:
+                os.close(fd)
+        except OSError:
+            # this is only a hint, the frame will be read normally
+            pass
+
+    @staticmethod
+    def _get_metadata_value(row, name):
+        """Returns the named field from a snapshot metadata row, or None if the row does not contain the field."""
+        index = TimelapseRenderJob._metadata_field_indexes[name]
+        return row[index] if index < len(row) else None
+
+    def _get_overlay_frame(self, file_path, data):
+        """Returns the jpeg encoded snapshot at file_path with the text overlay added."""
+        # TODO:  MAKE SURE THIS WORKS IF THERE ARE ANY ERRORS
+        # Variables the user can use in overlay_text_template.format().  Only the variables that appear in the
+        # template are calculated.
+        format_vars = utility.SafeDict()
+        fields = self._overlay_template_fields
+
+        # Extra metadata according to SnapshotMetadata.METADATA_FIELDS.
+        get_value = self._get_metadata_value
+        format_vars['snapshot_number'] = int(get_value(data, 'snapshot_number')) + 1
+        format_vars['file_name'] = get_value(data, 'file_name')
+        format_vars['time_taken_s'] = time_taken = float(get_value(data, 'time_taken'))
+
+        for name, convert, number_format in self._overlay_number_fields:
+            if name in fields:
+                value = get_value(data, name)
+                format_vars[name] = (
+                    "None" if value is None or value == "None" else number_format.format(convert(value))
                 )
 
-                # Open the image in Pillow and do preprocessing operations.
-                with Image.open(file_path) as img:
-                    img = self.add_overlay(img,
-                                           text_template=self._render_job_info.rendering.overlay_text_template,
-                                           format_vars=format_vars,
-                                           font_path=self._render_job_info.rendering.overlay_font_path,
-                                           font_size=self._render_job_info.rendering.overlay_font_size,
-                                           overlay_location=self._render_job_info.rendering.overlay_text_pos,
-                                           overlay_text_alignment=self._render_job_info.rendering.overlay_text_alignment,
-                                           overlay_text_valign=self._render_job_info.rendering.overlay_text_valign,
-                                           overlay_text_halign=self._render_job_info.rendering.overlay_text_halign,
-                                           text_color=self._render_job_info.rendering.get_overlay_text_color(),
-                                           outline_color=self._render_job_info.rendering.get_overlay_outline_color(),
-                                           outline_width=self._render_job_info.rendering.overlay_outline_width)
-                    # Save processed image.
-                    temp_file_name = "{0}.jpg".format(uuid.uuid4())
-                    output_path = os.path.join(self._temp_rendering_dir, temp_file_name)
-                    img.save(output_path)
-                utility.remove(file_path)
-                utility.move(output_path, file_path)
-            else:
-                logger.error("The snapshot at %s does not exist.  Skipping preprocessing.", file_path)
-        logger.info("Finished adding text overlays.")
+        # Calculate time elapsed since the beginning of the print.
+        if 'current_time' in fields:
+            format_vars['current_time'] = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(time_taken))
+        if 'time_elapsed' in fields:
+            format_vars['time_elapsed'] = "{}".format(
+                datetime.timedelta(seconds=round(time_taken - self._overlay_first_timestamp))
+            )
+
+        # Open the image in Pillow and do preprocessing operations.
+        with Image.open(file_path) as img:
+            img = self.add_overlay(img,
+                                   text_template=self._render_job_info.rendering.overlay_text_template,
+                                   format_vars=format_vars,
+                                   font_path=self._render_job_info.rendering.overlay_font_path,
+                                   font_size=self._render_job_info.rendering.overlay_font_size,
+                                   overlay_location=self._overlay_location,
+                                   overlay_text_alignment=self._render_job_info.rendering.overlay_text_alignment,
+                                   overlay_text_valign=self._render_job_info.rendering.overlay_text_valign,
+                                   overlay_text_halign=self._render_job_info.rendering.overlay_text_halign,
+                                   text_color=self._overlay_text_color,
+                                   outline_color=self._overlay_outline_color,
+                                   outline_width=self._render_job_info.rendering.overlay_outline_width,
+                                   # the decoded snapshot is thrown away after encoding, so don't copy it
+                                   in_place=True)
+            # Encode the processed image.
+            output = BytesIO()
+            img.save(output, format='JPEG')
+            return output.getvalue()
 
     @staticmethod
     def add_overlay(image, text_template, format_vars, font_path, font_size, overlay_location, overlay_text_alignment,
-                    overlay_text_valign, overlay_text_halign, text_color, outline_color, outline_width):
-        """Adds an overlay to an image with the given parameters. The image is not mutated.
+                    overlay_text_valign, overlay_text_halign, text_color, outline_color, outline_width,
+                    in_place=False):
+        """Adds an overlay to an image with the given parameters. The image is not mutated unless in_place is True.
         :param image: A Pillow RGB image.
+        :param overlay_location: The (x, y) text position, see RenderingProfile.get_overlay_text_pos.
         :returns The image with the overlay added."""
 
         text_color_tuple = tuple(text_color)
@@ -2021,29 +2258,32 @@ class TimelapseRenderJob(threading.Thread):
         text = text_template.format(**format_vars)
 
         # No font selected
-        if not font_path or not os.path.isfile(font_path):
+        if not font_path:
             raise RenderError('overlay-font', "The rendering overlay font path does not exist.  Check your rendering "
                                               "settings and select a different font.")
 
-        font = ImageFont.truetype(font_path, size=font_size)
-
-        # Create the image to draw on.
-        text_image = Image.new('RGBA', image.size, (255, 255, 255, 0))
-        d = ImageDraw.Draw(text_image)
+        # Rasterize the text once, then only blend the part of the image that it covers.  The font and the text are
+        # cached, so the font file is only opened (and checked) the first time it is used.
+        try:
+            text_layer, textsize, offset = get_overlay_text_layer(
+                text, font_path, font_size, overlay_text_alignment, text_color_tuple, outline_color_tuple,
+                outline_width
+            )
+        except IOError as e:
+            raise RenderError('overlay-font', "The rendering overlay font path does not exist.  Check your rendering "
+                                              "settings and select a different font.", cause=e)
 
         # Process the text position to improve the alignment.
-        if isinstance(overlay_location, string_types):
-            overlay_location = json.loads(overlay_location)
-        x, y = tuple(overlay_location)
+        x, y = overlay_location
+        image_width, image_height = image.size
+        text_width, text_height = textsize
         # valign.
         if overlay_text_valign == 'top':
             pass
         elif overlay_text_valign == 'middle':
-            textsize = d.multiline_textsize(text, font=font, spacing=0)
-            y += image.size[1] / 2 - textsize[1] / 2
+            y += image_height / 2 - text_height / 2
         elif overlay_text_valign == 'bottom':
-            textsize = d.multiline_textsize(text, font=font, spacing=0)
-            y += image.size[1] - textsize[1]
+            y += image_height - text_height
         else:
             raise RenderError('overlay-text-valign',
                               "An invalid overlay text valign ({0}) was specified.".format(overlay_text_valign))
@@ -2051,148 +2291,161 @@ class TimelapseRenderJob(threading.Thread):
         if overlay_text_halign == 'left':
             pass
         elif overlay_text_halign == 'center':
-            textsize = d.multiline_textsize(text, font=font, spacing=0)
-            x += image.size[0] / 2 - textsize[0] / 2
+            x += image_width / 2 - text_width / 2
         elif overlay_text_halign == 'right':
-            textsize = d.multiline_textsize(text, font=font, spacing=0)
-            x += image.size[0] - textsize[0]
+            x += image_width - text_width
         else:
             raise RenderError('overlay-text-halign',
                               "An invalid overlay text halign ({0}) was specified.".format(overlay_text_halign))
 
-        # Draw overlay text.
-        d.multiline_text(
-            xy=(x, y),
-            text=text,
-            fill=text_color_tuple,
-            font=font,
-            align=overlay_text_alignment,
-            stroke_width=outline_width,
-            stroke_fill=outline_color_tuple
+        return blend_text_layer(image, text_layer, offset, x, y, in_place=in_place)
 
+    def _sort_frames(self):
+        """Lists the snapshots in the temporary rendering directory in the order they will be rendered.  Snapshot
+           file names end with a zero padded snapshot number, so sorting them by name puts them in order.  The frames
+           are streamed to ffmpeg, so they do not need to be renamed to consecutive numbers."""
+        self._frame_file_names = sorted(
+            name for name in os.listdir(self._temp_rendering_dir) if name.lower().endswith(".jpg")
         )
 
-        return Image.alpha_composite(image.convert('RGBA'), text_image).convert('RGB')
-
-    def _rename_images(self, progress_key="rename_images", progress_current_step=None, progress_total_steps=None):
-        """Rename all images so that they start with 00000 and increment by 1.  This is requried for FFMPEG."""
-        # First, we need to rename our files, but we have to change the file name so that it won't overwrite any existing files
-        sorted_temp_files = sorted(os.listdir(self._temp_rendering_dir))
-        image_index = 0
-        if not progress_total_steps:
-            progress_total_steps = len(sorted_temp_files) * 2
-        if not progress_current_step:
-            progress_current_step = 0
-        # count the files and multiply by two since they need to be
-        # renamed twice (once with a tmp extention, and another to remove the
-        # tmp extension)
-        for filename in sorted_temp_files:
-            self.on_render_progress(progress_key, progress_current_step, progress_total_steps)
-            progress_current_step += 1
-            # make sure the file is a jpg image
-            if filename.lower().endswith(".jpg"):
-                output_path = os.path.join(
-                    self._temp_rendering_dir,
-                    "{0}.{1}".format(self._render_job_info.get_snapshot_name_from_index(image_index), utility.temporary_extension)
-                )
-                file_path = os.path.join(self._temp_rendering_dir, filename)
-                utility.move(file_path, output_path)
-                image_index += 1
-
-        # now loop back through all of the files and remove the .tmp extension
-        for filename in os.listdir(self._temp_rendering_dir):
-            self.on_render_progress(progress_key, progress_current_step, progress_total_steps)
-            progress_current_step += 1
-            extension = utility.get_extension_from_filename(filename)
-            if utility.is_valid_temporary_extension(extension):
-                src = os.path.join(self._temp_rendering_dir, filename)
-                dst = os.path.join(self._temp_rendering_dir, utility.remove_extension_from_filename(filename))
-                utility.move(src, dst)
-
     def _apply_pre_post_roll(self):
-        """Copies the first and final frames depending on the pre/post roll length for the given framerate.
-           Renames the images if any pre-roll frames were added so that they are all in sequence for ffmpeg.
+        """Calculates the number of pre and post roll frames for the given framerate.  No files are created, the
+           first and final frames are simply written to ffmpeg multiple times (see _write_frames).
         """
-        # Here we will be adding pre and post roll frames.
-        # This routine assumes that images exist, that the first image has number 0, and that
-        # there are no missing images
-        # start with pre_roll.
-        pre_roll_frames = int(self._render_job_info.rendering.pre_roll_seconds * self._fps)
-        post_roll_frames = int(self._render_job_info.rendering.post_roll_seconds * self._fps)
-        # calculate the number of total steps for the pre-post roll process
-        progress_total_steps = pre_roll_frames + post_roll_frames
-        if pre_roll_frames > 0:
-            # if there are any pre-roll frames, all files will need to be renamed again with a tmp extension
-            # and then again to remove the tmp extension.  All added pre/post roll frames will also need to be
-            # renamed
-            progress_total_steps += 2 * (len(os.listdir(self._temp_rendering_dir)) + pre_roll_frames + post_roll_frames)
-        progress_current_step = 0
-        if pre_roll_frames > 0:
-            logger.info("Adding %d pre-roll frames.", pre_roll_frames)
-            # We will be adding images starting with -1 and decrementing 1 until we've added the
-            # correct number of frames.
-
-            # create a variable to hold the new path of the first image
-            first_image_path = os.path.join(
-                self._temp_rendering_dir, self._render_job_info.snapshot_filename_format % 0
-            )
-
-            # rename all of the current files. The snapshot number should be
-            # incremented by the number of pre_roll frames. Start with the last
-            # image and work backwards to avoid overwriting files we've already moved
-            for image_number in range(pre_roll_frames):
-                self.on_render_progress('pre_post_roll', progress_current_step, progress_total_steps)
-                progress_current_step += 1
-                new_image_path = os.path.join(
-                    self._temp_rendering_dir,
-                    self._render_job_info.pre_roll_snapshot_filename_format % (0, image_number)
-                )
-                utility.fast_copy(first_image_path, new_image_path)
-
-        if post_roll_frames > 0:
-            last_frame_index = self._image_count - 1
-            last_image_path = os.path.join(
-                self._temp_rendering_dir, self._render_job_info.snapshot_filename_format % last_frame_index
-            )
-            logger.info("Adding %d post-roll frames.", post_roll_frames)
-            for post_roll_index in range(post_roll_frames):
-                self.on_render_progress('pre_post_roll', progress_current_step, progress_total_steps)
-                progress_current_step += 1
-
-                new_image_path = os.path.join(
-                    self._temp_rendering_dir,
-                    self._render_job_info.pre_roll_snapshot_filename_format % (last_frame_index, post_roll_index)
-                )
-                utility.fast_copy(last_image_path, new_image_path)
-        if pre_roll_frames > 0 or post_roll_frames > 0:
-            logger.info("Renaming images because pre-roll images were added.")
-            # pre or post roll frames were added, so we need to rename all of our images
-            self._rename_images(
-                progress_key="pre_post_roll",
-                progress_current_step=progress_current_step,
-                progress_total_steps=progress_total_steps
-            )
-
+        self._pre_roll_frames = int(self._render_job_info.rendering.pre_roll_seconds * self._fps)
+        self._post_roll_frames = int(self._render_job_info.rendering.post_roll_seconds * self._fps)
+        if self._pre_roll_frames > 0:
+            logger.info("Adding %d pre-roll frames.", self._pre_roll_frames)
+        if self._post_roll_frames > 0:
+            logger.info("Adding %d post-roll frames.", self._post_roll_frames)
         # update the image count
-        self._image_count += pre_roll_frames + post_roll_frames
+        self._image_count += self._pre_roll_frames + self._post_roll_frames
         logger.info("Pre/post roll generated successfully.")
 
+    def _prepare_after_render_frames(self):
+        """The after render script receives a directory with every rendered frame (including overlays and pre/post
+           roll frames), numbered from 0 with the snapshot file name template.  The frames are streamed into ffmpeg
+           rather than renamed, so when an after render script is set they are also written to their own directory
+           while they are streamed (see _write_frames)."""
+        if not self._render_job_info.camera.on_after_render_script.strip():
+            return
+        self._after_render_frames_dir = os.path.join(
+            self._temp_rendering_dir, TimelapseRenderJob._after_render_frames_subdirectory
+        )
+        if not os.path.exists(self._after_render_frames_dir):
+            os.makedirs(self._after_render_frames_dir)
+
+    def _get_frames(self):
+        """Yields every jpeg encoded frame in the order it should be rendered, including pre and post roll frames.
+           This routine assumes that the frames have been sorted with _sort_frames."""
+        num_snapshots = len(self._frame_file_names)
+        # _get_frame starts reading the frames that come after it, so start reading the first few here.
+        for index in range(self._frame_prefetch_distance):
+            self._prefetch_frame(index)
+        pool = None
+        # Every frame is independent, and Pillow releases the GIL while decoding, compositing and encoding, so add the
+        # overlays on a pool of threads.  More threads than cores would only compete with each other (and with
+        # ffmpeg), so there is no point in using more.  A pool is only worth starting if there is more than one
+        # thread and more than one frame that needs an overlay.
+        num_threads = min(self._threads, multiprocessing.cpu_count(), num_snapshots)
+        if self._add_overlays and num_threads > 1:
+            pool = ThreadPool(num_threads)
+        try:
+            if pool:
+                frames = self._get_frames_from_pool(pool, num_snapshots, num_threads * 4)
+            else:
+                frames = (self._get_frame(index) for index in range(num_snapshots))
+            last_frame = None
+            for index, frame in enumerate(frames):
+                if index == 0:
+                    for _ in range(self._pre_roll_frames):
+                        yield frame
+                yield frame
+                last_frame = frame
+            for _ in range(self._post_roll_frames):
+                yield last_frame
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+
+    def _get_frames_from_pool(self, pool, num_frames, max_pending):
+        """Yields the frames in order while they are prepared on a pool.  Up to max_pending frames are in progress
+           at once.  As soon as the oldest one is done it is yielded and another is started, so the threads never
+           wait for each other and only a few frames are held in memory."""
+        pending = deque()
+        next_index = 0
+        while pending or next_index < num_frames:
+            while next_index < num_frames and len(pending) < max_pending:
+                pending.append(pool.apply_async(self._get_frame, (next_index,)))
+                next_index += 1
+            yield pending.popleft().get()
+
+    @staticmethod
+    def _put_frame(frame_queue, frame, stop_event):
+        """Adds a frame to the queue, waiting for room.  Returns False if the stream was stopped."""
+        while not stop_event.is_set():
+            try:
+                frame_queue.put(frame, timeout=0.5)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _produce_frames(self, frame_queue, stop_event):
+        """Fills the frame queue, and adds None when there are no more frames."""
+        frames = self._get_frames()
+        try:
+            for frame in frames:
+                if not TimelapseRenderJob._put_frame(frame_queue, frame, stop_event):
+                    return
+        except Exception as e:
+            logger.exception("An error occurred while preparing frames for ffmpeg.")
+            self._frame_error = e
+        finally:
+            frames.close()
+            TimelapseRenderJob._put_frame(frame_queue, None, stop_event)
+
+    def _write_frames(self, stdin):
+        """Streams every frame into ffmpeg's stdin.  Frames are prepared on a producer thread so that adding overlays
+           overlaps with encoding.  The queue is bounded, so the producer is throttled when ffmpeg falls behind."""
+        frame_queue = queue.Queue(maxsize=self._frame_queue_size)
+        stop_event = threading.Event()
+        producer = threading.Thread(target=self._produce_frames, args=[frame_queue, stop_event])
+        producer.daemon = True
+        producer.start()
+        try:
+            frame_index = 0
+            while True:
+                frame = frame_queue.get()
+                if frame is None:
+                    break
+                stdin.write(frame)
+                if self._after_render_frames_dir is not None:
+                    frame_path = os.path.join(
+                        self._after_render_frames_dir, self._render_job_info.snapshot_filename_format % frame_index
+                    )
+                    with open(frame_path, 'wb') as frame_file:
+                        frame_file.write(frame)
+                frame_index += 1
+        finally:
+            # stop the producer in case ffmpeg quit reading
+            stop_event.set()
+            producer.join()
 
     def _post_render_script(self):
         """Run any post render script that is configured within the camera profile."""
         script_path = self._render_job_info.camera.on_after_render_script.strip()
         if not script_path:
             return
-        self.on_render_progress('post_render_script')
         # Todo:  add the original snapshot directory and template path
-        logger.debug("Executing post-render script.")
         cmd = script.CameraScriptAfterRender(
             script_path,
             self._render_job_info.camera.name,
-            self._temp_rendering_dir,
+            self._after_render_frames_dir,
             self._render_job_info.snapshot_filename_format,
             os.path.join(
-                self._temp_rendering_dir,
+                self._after_render_frames_dir,
                 self._render_job_info.snapshot_filename_format
             ),
             self._output_directory,
@@ -2200,13 +2453,22 @@ class TimelapseRenderJob(threading.Thread):
             self._output_extension,
             self._output_filepath
         )
+        self._after_render_error = self._run_render_script(
+            cmd, 'post_render_script', 'after_render_script_error', 'after-render'
+        )
+
+    def _run_render_script(self, cmd, progress_key, error_type, script_description):
+        """Run a before or after render script, returning a RenderError if it failed, else None."""
+        self.on_render_progress(progress_key)
+        logger.debug("Executing the %s script.", script_description)
         cmd.run()
         if not cmd.success():
-            self._after_render_error = RenderError(
-                'after_render_script_error',
-                "A script occurred while executing executing the after-render script.  Check "
-                "plugin_octolapse.log for details. "
+            return RenderError(
+                error_type,
+                "A script occurred while executing executing the {0} script.  Check "
+                "plugin_octolapse.log for details. ".format(script_description)
             )
+        return None
 
     def _get_num_temporary_files(self):
         """Returns the number of files within the temporary rendering directory.
@@ -2223,6 +2485,8 @@ class TimelapseRenderJob(threading.Thread):
     ):
         """Delete all temporary rendering files, and report progress."""
         logger.debug("Cleaning all temporary rendering files.")
+        if self._after_render_frames_dir is not None and os.path.isdir(self._after_render_frames_dir):
+            shutil.rmtree(self._after_render_frames_dir, ignore_errors=True)
         if os.path.isdir(self._temp_rendering_dir):
             temp_rendering_files = os.listdir(self._temp_rendering_dir)
             if progress_total_steps is None:
@@ -2252,33 +2516,94 @@ class TimelapseRenderJob(threading.Thread):
     ## FFMPEG functions
     ###################
 
-    def _create_ffmpeg_command_args(self, input_file_format, output_file, watermark=None, pix_fmt="yuv420p"):
+    def _get_hardware_vcodec(self):
+        """Returns the hardware encoder to use for this rendering, or None to use the software encoder."""
+        if not self._render_job_info.rendering.enable_hardware_encoding:
+            return None
+        v_codec = RenderJobInfo.get_hardware_vcodec(
+            self._render_job_info.rendering.output_format, get_ffmpeg_encoders(self._ffmpeg)
+        )
+        if v_codec is None:
+            logger.info(
+                "Hardware encoding is enabled, but ffmpeg has no hardware encoder for the %s output format.",
+                self._render_job_info.rendering.output_format
+            )
+        return v_codec
+
+    def _render_movie(self, output_file, watermark):
+        """Renders the frames with a hardware encoder if enabled and available, and returns the finished ffmpeg
+           process.  The frames can be streamed again, so fall back to the software encoder if the hardware encoder
+           fails."""
+        software_v_codec = RenderJobInfo.get_vcodec_from_output_format(self._render_job_info.rendering.output_format)
+        v_codec = self._get_hardware_vcodec() or software_v_codec
+        p = self._run_ffmpeg(output_file, v_codec, watermark)
+        if p.return_code != 0 and self._frame_error is None and v_codec != software_v_codec:
+            logger.warning(
+                "The %s hardware encoder failed with return code %s, rendering again with %s.",
+                v_codec, p.return_code, software_v_codec
+            )
+            p = self._run_ffmpeg(output_file, software_v_codec, watermark)
+        return p
+
+    def _run_ffmpeg(self, output_file, v_codec, watermark):
+        """Runs ffmpeg, streaming the frames into stdin, and returns the finished process."""
+        # prepare ffmpeg command.  The frames are streamed into stdin.
+        command_args = self._create_ffmpeg_command_args(output_file, v_codec, watermark=watermark)
+        logger.info("Running ffmpeg.")
+        try:
+            # create an async thread, along with a callback for processing ffmpeg debug output
+            # for calculating progress
+            p = script.POpenWithTimeoutAsync(
+                on_stderr_line_received=self._process_ffmpeg_output,
+                stdin_writer=self._write_frames,
+                max_output_lines=self._ffmpeg_output_line_count
+            )
+            p.run(command_args)
+        except Exception as e:
+            logger.exception("An exception occurred while running the ffmpeg process.")
+            raise RenderError('rendering-exception', "ffmpeg failed during rendering of movie. "
+                                                     "Please check plugin_octolapse.log for details.",
+                              cause=e)
+        return p
+
+    def _create_ffmpeg_command_args(self, output_file, v_codec, watermark=None, pix_fmt="yuv420p"):
         """
-        Create ffmpeg command string based on input parameters.
+        Create the ffmpeg argument list based on input parameters.  Frames are read as a stream of jpegs from stdin.
+        The arguments are passed to ffmpeg directly, without a shell, so nothing needs to be quoted.
         Arguments:
-            input_file_format (str): Absolute path to input files including file mask
             output_file (str): Absolute path to output file
+            v_codec (str): The ffmpeg video encoder to use.
             watermark (str): Path to watermark to apply to lower left corner.
             pix_fmt (str): Pixel format to use for output. Default of yuv420p should usually fit the bill.
         Returns:
-            (str): Prepared command string to render `input` to `output` using ffmpeg.
+            (list): Prepared arguments to render the frames to `output_file` using ffmpeg.
         """
 
-        v_codec = RenderJobInfo.get_vcodec_from_output_format(self._render_job_info.rendering.output_format)
-
-        command = [self._ffmpeg, '-framerate', "{}".format(self._fps), '-loglevel', 'info', '-i', input_file_format]
+        output_container = RenderJobInfo.get_ffmpeg_format_from_output_format(
+            self._render_job_info.rendering_output_format
+        )
+        command = [
+            self._ffmpeg, '-f', 'image2pipe', '-vcodec', 'mjpeg', '-framerate', "{}".format(self._fps),
+            '-loglevel', 'info', '-i', 'pipe:0'
+        ]
         command.extend([
             '-threads', "{}".format(self._threads),
             '-r', "{}".format(self._fps),
             '-y',
             '-vcodec', v_codec,
-            '-f', RenderJobInfo.get_ffmpeg_format_from_output_format(self._render_job_info.rendering_output_format)]
+            '-f', output_container]
         )
+        # Move the mp4 index to the start of the file once encoding is complete so that playback can start before
+        # the whole file has been downloaded.
+        if output_container == "mp4":
+            command.extend(["-movflags", "+faststart"])
 
         # special parameters from h265
         if self._render_job_info.rendering.output_format == "h265":
+            command.extend(["-tag:v", "hvc1"])
+        # the constant rate factor is a libx265 option, the hardware encoders use the bitrate.
+        if v_codec == "libx265":
             command.extend([
-                "-tag:v", "hvc1",
                 "-crf", "{}".format(self._render_job_info.rendering.constant_rate_factor),
             ])
         else:
@@ -23,6 +23,7 @@
 from __future__ import unicode_literals
 import subprocess
 import threading
+from collections import deque
 import psutil
 import os
 import sys
@@ -362,11 +363,15 @@ class POpenWithTimeoutAsync(object):
 
     lock = threading.Lock()
 
-    def __init__(self, on_stdout_line_received=None, on_stderr_line_received=None):
+    def __init__(self, on_stdout_line_received=None, on_stderr_line_received=None, stdin_writer=None,
+                 max_output_lines=None):
         self.name = "Unknown"
         self.proc = None
-        self.stdout_lines = []
-        self.stderr_lines = []
+        # When max_output_lines is set only the most recent lines are kept, which prevents long running processes
+        # that report progress (ffmpeg) from accumulating all of their output in memory.  Every line is still logged
+        # and sent to the line received callbacks.
+        self.stdout_lines = deque(maxlen=max_output_lines)
+        self.stderr_lines = deque(maxlen=max_output_lines)
         self.error_message = None
         self.completed = False
         self._exception = None
@@ -380,6 +385,9 @@ class POpenWithTimeoutAsync(object):
         self._success = False
         self.stdout_line_received_callback = on_stdout_line_received
         self.stderr_line_received_callback = on_stderr_line_received
+        # an optional function that receives the (binary) stdin of the process and writes to it.  stdin is closed
+        # after the function returns.
+        self.stdin_writer = stdin_writer
 
     def success(self):
         return self._success
@@ -491,27 +499,42 @@ class POpenWithTimeoutAsync(object):
 
     def _read_stdout_lines(self, proc):
         try:
-            while proc.returncode is None:
-                line = proc.stdout.readline()
+            # read until the pipe is closed rather than until the process exits, else any output still buffered
+            # when the process exits (often the error) would be lost.
+            for line in iter(proc.stdout.readline, ''):
                 line = POpenWithTimeoutAsync._read_std_line(line, 'stdout', self.stdout_line_received_callback)
                 if line:
                     self.stdout_lines.append(line)
-                proc.poll()
         except Exception as e:
             logger.exception("An error occurred while reading stdout.")
             raise e
 
     def _read_stderr_lines(self, proc):
         try:
-            while proc.returncode is None:
-                line = proc.stderr.readline()
+            # read until the pipe is closed rather than until the process exits, else any output still buffered
+            # when the process exits (often the error) would be lost.
+            for line in iter(proc.stderr.readline, ''):
                 line = POpenWithTimeoutAsync._read_std_line(line, 'stderr', self.stderr_line_received_callback)
                 if line:
                     self.stderr_lines.append(line)
-                proc.poll()
         except Exception as e:
             logger.exception("An error occurred while reading stderr.")
             raise e
+
+    def _write_stdin(self, proc):
+        # universal_newlines puts stdin into text mode, so write to the underlying binary buffer if there is one.
+        stdin = getattr(proc.stdin, 'buffer', proc.stdin)
+        try:
+            self.stdin_writer(stdin)
+        except (IOError, OSError):
+            # The process most likely exited before reading all of its input.  The return code will report the error.
+            logger.exception("An error occurred while writing to stdin.")
+        finally:
+            try:
+                proc.stdin.close()
+            except (IOError, OSError):
+                pass
+
     # run a command with the provided args, timeout in timeout_seconds
     def run(self, args, timeout_seconds=None):
         self.log_command(args, timeout_seconds)
@@ -544,8 +567,17 @@ class POpenWithTimeoutAsync(object):
                     # don't start the process if we've already timed out
                     if not self.completed:
                         self.proc = subprocess.Popen(
-                            args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True
+                            args,
+                            stdin=subprocess.PIPE if self.stdin_writer else None,
+                            stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE,
+                            universal_newlines=True
                         )
+                        stdin_writer = None
+                        if self.stdin_writer:
+                            stdin_writer = threading.Thread(target=self._write_stdin, args=[self.proc])
+                            stdin_writer.daemon = True
+                            stdin_writer.start()
                         # create threads to read stdin and stdout
                         stdout_reader = threading.Thread(target=self._read_stdout_lines, args=[self.proc])
                         stdout_reader.daemon = True
@@ -554,6 +586,8 @@ class POpenWithTimeoutAsync(object):
                         stdout_reader.start()
                         stderr_reader.start()
                         self.proc.wait()
+                        if stdin_writer:
+                            stdin_writer.join()
                         stdout_reader.join()
                         stderr_reader.join()
                     else:
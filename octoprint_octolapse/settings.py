@@ -1156,6 +1156,8 @@ class RenderingProfile(AutomaticConfigurationProfile):
         self.overlay_outline_color = [0, 0, 0, 1.0]
         self.overlay_outline_width = 1
         self.thread_count = 1
+        # Use a hardware encoder for h264/h265 when ffmpeg has one, falling back to software encoding.
+        self.enable_hardware_encoding = False
         # Snapshot Cleanup
         self.archive_snapshots = False
 
@@ -1165,6 +1167,13 @@ class RenderingProfile(AutomaticConfigurationProfile):
     def get_overlay_outline_color(self):
         return RenderingProfile._get_color_(self.overlay_outline_color)
 
+    def get_overlay_text_pos(self):
+        overlay_text_pos = self.overlay_text_pos
+        if isinstance(overlay_text_pos, six.string_types):
+            overlay_text_pos = json.loads(overlay_text_pos)
+        x, y = overlay_text_pos
+        return x, y
+
     @staticmethod
     def _get_color_(rgba_color):
         overlay_text_color = [255, 255, 255, 1.0]
@@ -73,6 +73,7 @@ $(function() {
         self.overlay_font_size = ko.observable(values.overlay_font_size);
         self.archive_snapshots = ko.observable(values.archive_snapshots);
         self.thread_count = ko.observable(values.thread_count);
+        self.enable_hardware_encoding = ko.observable(values.enable_hardware_encoding);
         self.data.font_list = ko.observableArray(); // A list of Fonts that are available for selection on the server.
         // Text position as a JSON string.
         self.overlay_text_pos = ko.pureComputed({
@@ -381,6 +382,7 @@ $(function() {
             self.output_template(values.output_template);
             self.archive_snapshots(values.archive_snapshots);
             self.thread_count(values.thread_count);
+            self.enable_hardware_encoding(values.enable_hardware_encoding);
             // Clear any settings that we don't want to update, unless they aren't important.
             self.overlay_text_template("");
             self.selected_watermark("");
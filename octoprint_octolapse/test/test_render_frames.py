@@ -0,0 +1,382 @@
+# coding=utf-8
+##################################################################################
+# Octolapse - A plugin for OctoPrint used for making stabilized timelapse videos.
+# Copyright (C) 2020  Brad Hochgesang
+##################################################################################
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see the following:
+# https://github.com/FormerLurker/Octolapse/blob/master/LICENSE
+#
+# You can contact the author either through the git-hub repository, or at the
+# following email address: FormerLurker@pm.me
+##################################################################################
+import csv
+import json
+import os
+import stat
+import sys
+import unittest
+from io import BytesIO
+from shutil import rmtree
+from tempfile import mkdtemp
+
+from PIL import Image
+
+import octoprint_octolapse.utility as utility
+from octoprint_octolapse.render import TimelapseRenderJob, RenderJobInfo, RenderError, get_ffmpeg_encoders
+from octoprint_octolapse.settings import RenderingProfile, CameraProfile
+from octoprint_octolapse.snapshot import SnapshotMetadata
+
+
+class RenderJobInfoStub(RenderJobInfo):
+    """The parts of RenderJobInfo that are needed to stream frames, without a timelapse job."""
+    def __init__(self, temporary_directory, rendering):
+        self.temporary_directory = temporary_directory
+        self.snapshot_directory = temporary_directory
+        self.snapshot_filename_format = "test" + utility.SnapshotNumberFormat + ".jpg"
+        self.rendering = rendering
+        self.ffmpeg_directory = None
+        self.archive_snapshots = False
+
+
+class FailingStdin(object):
+    """A stdin that stops accepting frames after a number of writes, like ffmpeg exiting early."""
+    def __init__(self, max_writes):
+        self.max_writes = max_writes
+        self.writes = 0
+
+    def write(self, frame):
+        if self.writes >= self.max_writes:
+            raise IOError("Broken pipe")
+        self.writes += 1
+
+
+# the start of 'ffmpeg -hide_banner -encoders' output
+FFMPEG_ENCODERS = """Encoders:
+ V..... = Video
+ A..... = Audio
+ S..... = Subtitle
+ .F.... = Frame-level multithreading
+ ..S... = Slice-level multithreading
+ ...X.. = Codec is experimental
+ ....B. = Supports draw_horiz_band
+ .....D = Supports direct rendering method 1
+ ------
+ V..... libx264              libx264 H.264 / AVC / MPEG-4 AVC / MPEG-4 part 10 (codec h264)
+ V..... h264_omx             OpenMAX IL H.264 video encoder (codec h264)
+ V..... h264_v4l2m2m         V4L2 mem2mem H.264 encoder wrapper (codec h264)
+ V..... libx265              libx265 H.265 / HEVC (codec hevc)
+ V..... mpeg4                MPEG-4 part 2
+ A..... aac                  AAC (Advanced Audio Coding)
+"""
+
+# A stand in for ffmpeg.  It lists FFMPEG_ENCODERS, and otherwise counts the jpegs streamed into stdin, logs its
+# arguments and the frame count, and fails if it was asked to use a hardware encoder.
+FFMPEG_STUB = """#!{python}
+import json
+import sys
+
+args = sys.argv[1:]
+if '-encoders' in args:
+    sys.stdout.write({encoders!r})
+    sys.exit(0)
+frames = getattr(sys.stdin, 'buffer', sys.stdin).read()
+with open({log_path!r}, 'a') as log_file:
+    log_file.write(json.dumps({{'args': args, 'frames': frames.count(b'\\xff\\xd8\\xff')}}) + '\\n')
+sys.exit(1 if set(args) & set({hardware_vcodecs!r}) else 0)
+"""
+
+
+class TestRenderFrames(unittest.TestCase):
+    image_size = (160, 120)
+    font_path = os.path.join(
+        os.path.dirname(os.path.dirname(__file__)), "data", "fonts", "DejaVu", "DejaVuSansMono.ttf"
+    )
+
+    def setUp(self):
+        self.temporary_directory = mkdtemp()
+        self.rendering_directory = utility.get_temporary_rendering_directory(self.temporary_directory)
+        os.makedirs(self.rendering_directory)
+
+    def tearDown(self):
+        rmtree(self.temporary_directory)
+
+    @staticmethod
+    def get_file_name(snapshot_number):
+        return "test{0:06d}.jpg".format(snapshot_number)
+
+    @staticmethod
+    def get_color(snapshot_number):
+        return (snapshot_number * 20 % 256, 255 - snapshot_number * 20 % 256, 128)
+
+    def create_job(self, num_snapshots, overlay_text_template="", thread_count=1, pre_roll_frames=0,
+                   post_roll_frames=0, missing_snapshots=()):
+        """Creates a render job with its snapshots copied into the temporary rendering directory, ready to stream.
+        A metadata row is written for every snapshot, including the missing ones, as the snapshot code does."""
+        metadata_path = os.path.join(self.temporary_directory, SnapshotMetadata.METADATA_FILE_NAME)
+        with open(metadata_path, 'w') as metadata_file:
+            writer = csv.writer(metadata_file)
+            for snapshot_number in range(num_snapshots):
+                file_name = self.get_file_name(snapshot_number)
+                writer.writerow([snapshot_number, file_name, 1000 + snapshot_number * 10])
+                if snapshot_number not in missing_snapshots:
+                    Image.new('RGB', self.image_size, color=self.get_color(snapshot_number)).save(
+                        os.path.join(self.rendering_directory, file_name)
+                    )
+
+        rendering = RenderingProfile()
+        rendering.thread_count = thread_count
+        rendering.overlay_text_template = overlay_text_template
+        rendering.overlay_font_path = self.font_path
+        rendering.overlay_font_size = 10
+        job = TimelapseRenderJob(
+            RenderJobInfoStub(self.temporary_directory, rendering), None, None, None, None, None, None, None
+        )
+        job._read_snapshot_metadata()
+        job._sort_frames()
+        job._prepare_text_overlays()
+        job._pre_roll_frames = pre_roll_frames
+        job._post_roll_frames = post_roll_frames
+        return job
+
+    def create_ffmpeg_stub(self):
+        """Writes an executable ffmpeg stub (see FFMPEG_STUB), and returns its path and the path of its log."""
+        ffmpeg_path = os.path.join(self.temporary_directory, "ffmpeg")
+        log_path = os.path.join(self.temporary_directory, "ffmpeg.log")
+        hardware_vcodecs = sorted(
+            codec for codecs in RenderJobInfo.HARDWARE_VCODECS.values() for codec in codecs
+        )
+        with open(ffmpeg_path, 'w') as ffmpeg_file:
+            ffmpeg_file.write(FFMPEG_STUB.format(
+                python=sys.executable, encoders=FFMPEG_ENCODERS, log_path=log_path,
+                hardware_vcodecs=hardware_vcodecs
+            ))
+        os.chmod(ffmpeg_path, os.stat(ffmpeg_path).st_mode | stat.S_IXUSR)
+        return ffmpeg_path, log_path
+
+    @staticmethod
+    def read_ffmpeg_stub_log(log_path):
+        """Returns the arguments and frame count of every ffmpeg stub run."""
+        with open(log_path) as log_file:
+            return [json.loads(line) for line in log_file]
+
+    def create_ffmpeg_job(self, num_snapshots, output_format, enable_hardware_encoding=False, **kwargs):
+        """Creates a render job (see create_job) that renders with the ffmpeg stub."""
+        job = self.create_job(num_snapshots, **kwargs)
+        job._render_job_info.rendering.output_format = output_format
+        job._render_job_info.rendering_output_format = output_format
+        job._render_job_info.rendering.enable_hardware_encoding = enable_hardware_encoding
+        job._fps = 10
+        job._ffmpeg, log_path = self.create_ffmpeg_stub()
+        return job, log_path
+
+    @staticmethod
+    def stream(job):
+        """Streams the frames like ffmpeg would receive them, and splits the stream back into jpegs."""
+        stdin = BytesIO()
+        job._write_frames(stdin)
+        start_of_image = b'\xff\xd8\xff'
+        return [start_of_image + frame for frame in stdin.getvalue().split(start_of_image)[1:]]
+
+    def get_snapshot_bytes(self, snapshot_number):
+        with open(os.path.join(self.rendering_directory, self.get_file_name(snapshot_number)), 'rb') as snapshot:
+            return snapshot.read()
+
+    def get_frame_color(self, frame):
+        """Returns the color of the bottom right corner of a frame, which the overlay text does not cover."""
+        with Image.open(BytesIO(frame)) as image:
+            return image.getpixel((self.image_size[0] - 1, self.image_size[1] - 1))
+
+    def assertColorAlmostEqual(self, expected, actual):
+        # jpeg compression changes the colors a little
+        for expected_component, actual_component in zip(expected, actual):
+            self.assertLessEqual(abs(expected_component - actual_component), 8, (expected, actual))
+
+    def test_write_frames(self):
+        """Test that every snapshot is streamed unchanged and in order when there are no overlays."""
+        job = self.create_job(5)
+        frames = self.stream(job)
+        self.assertIsNone(job._frame_error)
+        self.assertEqual([self.get_snapshot_bytes(number) for number in range(5)], frames)
+
+    def test_write_frames_pre_post_roll(self):
+        """Test that the first and last frames are repeated for the pre and post roll."""
+        job = self.create_job(5, pre_roll_frames=2, post_roll_frames=3)
+        frames = self.stream(job)
+        self.assertEqual(10, len(frames))
+        self.assertEqual([self.get_snapshot_bytes(0)] * 3, frames[:3])
+        self.assertEqual([self.get_snapshot_bytes(number) for number in range(1, 4)], frames[3:6])
+        self.assertEqual([self.get_snapshot_bytes(4)] * 4, frames[6:])
+
+    def test_write_frames_overlay_order(self):
+        """Test that frames with overlays are streamed in order, with and without the thread pool."""
+        for thread_count in (1, 4):
+            job = self.create_job(20, overlay_text_template="{snapshot_number}", thread_count=thread_count,
+                                  pre_roll_frames=1, post_roll_frames=1)
+            frames = self.stream(job)
+            self.assertIsNone(job._frame_error)
+            self.assertEqual(22, len(frames))
+            expected_numbers = [0] + list(range(20)) + [19]
+            for snapshot_number, frame in zip(expected_numbers, frames):
+                self.assertNotEqual(self.get_snapshot_bytes(snapshot_number), frame)
+                self.assertColorAlmostEqual(self.get_color(snapshot_number), self.get_frame_color(frame))
+            rmtree(self.rendering_directory)
+            os.makedirs(self.rendering_directory)
+
+    def test_overlay_metadata_missing_snapshot(self):
+        """Test that each overlay uses the metadata of its own snapshot when a snapshot is missing."""
+        job = self.create_job(12, overlay_text_template="{file_name} {current_time}", thread_count=3,
+                              missing_snapshots=(3,))
+        overlays = []
+
+        def add_overlay(image, format_vars, **kwargs):
+            overlays.append((os.path.basename(image.filename), format_vars['file_name'], format_vars['time_taken_s']))
+            return image
+
+        job.add_overlay = add_overlay
+        frames = self.stream(job)
+        self.assertIsNone(job._frame_error)
+        self.assertEqual(11, len(frames))
+        expected_numbers = [number for number in range(12) if number != 3]
+        self.assertEqual(
+            [(self.get_file_name(number), self.get_file_name(number), 1000.0 + number * 10)
+             for number in expected_numbers],
+            sorted(overlays)
+        )
+
+    def test_write_frames_after_render_script(self):
+        """Test that the rendered frames are numbered from 0 in their own directory when there is an after render
+        script, including pre and post roll frames, even if a snapshot is missing."""
+        job = self.create_job(6, overlay_text_template="{snapshot_number}", thread_count=2, pre_roll_frames=2,
+                              post_roll_frames=1, missing_snapshots=(2,))
+        job._render_job_info.camera = CameraProfile()
+        job._render_job_info.camera.on_after_render_script = "after_render.sh"
+        job._prepare_after_render_frames()
+        frames = self.stream(job)
+        self.assertIsNone(job._frame_error)
+        self.assertEqual(8, len(frames))
+        self.assertEqual([self.get_file_name(number) for number in range(8)],
+                         sorted(os.listdir(job._after_render_frames_dir)))
+        for number, frame in enumerate(frames):
+            with open(os.path.join(job._after_render_frames_dir, self.get_file_name(number)), 'rb') as frame_file:
+                self.assertEqual(frame, frame_file.read())
+
+    def test_write_frames_without_after_render_script(self):
+        """Test that the rendered frames are only kept when there is an after render script."""
+        job = self.create_job(3)
+        job._render_job_info.camera = CameraProfile()
+        job._prepare_after_render_frames()
+        self.stream(job)
+        self.assertIsNone(job._after_render_frames_dir)
+        self.assertEqual(
+            [self.get_file_name(number) for number in range(3)], sorted(os.listdir(self.rendering_directory))
+        )
+
+    def test_write_frames_error(self):
+        """Test that an error while preparing the frames stops the stream and is reported."""
+        job = self.create_job(20, overlay_text_template="{snapshot_number}", thread_count=4)
+        job._render_job_info.rendering.overlay_text_valign = 'invalid'
+        frames = self.stream(job)
+        self.assertEqual([], frames)
+        self.assertIsInstance(job._frame_error, RenderError)
+        self.assertEqual('overlay-text-valign', job._frame_error.type)
+
+    def test_write_frames_stdin_closed(self):
+        """Test that the stream stops, and the error is raised, when ffmpeg stops reading frames."""
+        job = self.create_job(20, overlay_text_template="{snapshot_number}", thread_count=4)
+        stdin = FailingStdin(2)
+        with self.assertRaises(IOError):
+            job._write_frames(stdin)
+        self.assertEqual(2, stdin.writes)
+
+    def test_prepare_text_overlays_invalid_alignment(self):
+        """Test that invalid overlay alignments are rejected before any frames are streamed."""
+        job = self.create_job(2)
+        job._render_job_info.rendering.overlay_text_template = "{snapshot_number}"
+        job._render_job_info.rendering.overlay_text_halign = 'invalid'
+        with self.assertRaises(RenderError) as context:
+            job._prepare_text_overlays()
+        self.assertEqual('overlay-text-halign', context.exception.type)
+
+    def test_get_ffmpeg_encoders(self):
+        """Test that the encoders are read from the listing after the separator, and that they are cached."""
+        ffmpeg_path, _ = self.create_ffmpeg_stub()
+        expected_encoders = {"libx264", "h264_omx", "h264_v4l2m2m", "libx265", "mpeg4", "aac"}
+        self.assertEqual(expected_encoders, get_ffmpeg_encoders(ffmpeg_path))
+        # ffmpeg is only run once
+        os.remove(ffmpeg_path)
+        self.assertEqual(expected_encoders, get_ffmpeg_encoders(ffmpeg_path))
+        # no encoders are available if ffmpeg can't be run
+        self.assertEqual(set(), get_ffmpeg_encoders(os.path.join(self.temporary_directory, "missing_ffmpeg")))
+
+    def test_get_hardware_vcodec(self):
+        """Test that the preferred available hardware encoder is chosen for the output format."""
+        all_encoders = {"libx264", "libx265", "h264_nvenc", "h264_v4l2m2m", "h264_omx", "hevc_nvenc", "hevc_v4l2m2m"}
+        self.assertEqual("h264_nvenc", RenderJobInfo.get_hardware_vcodec("h264", all_encoders))
+        self.assertEqual("h264_v4l2m2m", RenderJobInfo.get_hardware_vcodec("h264", {"h264_v4l2m2m", "h264_omx"}))
+        self.assertEqual("h264_omx", RenderJobInfo.get_hardware_vcodec("H264", {"libx264", "h264_omx"}))
+        self.assertEqual("hevc_nvenc", RenderJobInfo.get_hardware_vcodec("h265", all_encoders))
+        self.assertEqual("hevc_v4l2m2m", RenderJobInfo.get_hardware_vcodec("h265", {"libx265", "hevc_v4l2m2m"}))
+        self.assertIsNone(RenderJobInfo.get_hardware_vcodec("h264", {"libx264", "libx265"}))
+        self.assertIsNone(RenderJobInfo.get_hardware_vcodec("mp4", all_encoders))
+
+    def test_create_ffmpeg_command_args_rate_control(self):
+        """Test that only libx265 gets a constant rate factor, and every other encoder gets the bitrate."""
+        job, _ = self.create_ffmpeg_job(2, "h265")
+        job._render_job_info.rendering.bitrate = "4000K"
+        job._render_job_info.rendering.constant_rate_factor = 23
+        for v_codec, output_format, expected_option, unexpected_option in (
+            ("libx265", "h265", ["-crf", "23"], "-b:v"),
+            ("hevc_nvenc", "h265", ["-b:v", "4000K"], "-crf"),
+            ("libx264", "h264", ["-b:v", "4000K"], "-crf"),
+            ("h264_v4l2m2m", "h264", ["-b:v", "4000K"], "-crf"),
+        ):
+            job._render_job_info.rendering.output_format = output_format
+            job._render_job_info.rendering_output_format = output_format
+            args = job._create_ffmpeg_command_args("output.tmp", v_codec)
+            self.assertEqual(v_codec, args[args.index("-vcodec", args.index("pipe:0")) + 1])
+            option_index = args.index(expected_option[0])
+            self.assertEqual(expected_option, args[option_index:option_index + 2])
+            self.assertNotIn(unexpected_option, args)
+            self.assertEqual("output.tmp", args[-1])
+
+    def test_render_movie_software(self):
+        """Test that the software encoder is used, once, when hardware encoding is disabled."""
+        job, log_path = self.create_ffmpeg_job(5, "h264", pre_roll_frames=1)
+        p = job._render_movie("output.tmp", None)
+        self.assertEqual(0, p.return_code)
+        runs = self.read_ffmpeg_stub_log(log_path)
+        self.assertEqual(1, len(runs))
+        self.assertIn("libx264", runs[0]['args'])
+        self.assertEqual(6, runs[0]['frames'])
+
+    def test_render_movie_hardware_fallback(self):
+        """Test that a failed hardware encode is rendered again with the software encoder and every frame."""
+        job, log_path = self.create_ffmpeg_job(
+            5, "h264", enable_hardware_encoding=True, overlay_text_template="{snapshot_number}", thread_count=2,
+            pre_roll_frames=1, post_roll_frames=2
+        )
+        output_path = os.path.join(self.temporary_directory, "output.tmp")
+        p = job._render_movie(output_path, None)
+        self.assertEqual(0, p.return_code)
+        self.assertIsNone(job._frame_error)
+        runs = self.read_ffmpeg_stub_log(log_path)
+        self.assertEqual(2, len(runs))
+        hardware_args, software_args = runs[0]['args'], runs[1]['args']
+        self.assertIn("h264_v4l2m2m", hardware_args)
+        self.assertNotIn("libx264", hardware_args)
+        self.assertEqual(
+            [arg.replace("h264_v4l2m2m", "libx264") for arg in hardware_args], software_args
+        )
+        self.assertEqual(output_path, software_args[-1])
+        self.assertEqual([8, 8], [run['frames'] for run in runs])
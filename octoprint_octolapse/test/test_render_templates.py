@@ -0,0 +1,74 @@
+# coding=utf-8
+##################################################################################
+# Octolapse - A plugin for OctoPrint used for making stabilized timelapse videos.
+# Copyright (C) 2020  Brad Hochgesang
+##################################################################################
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see the following:
+# https://github.com/FormerLurker/Octolapse/blob/master/LICENSE
+#
+# You can contact the author either through the git-hub repository, or at the
+# following email address: FormerLurker@pm.me
+##################################################################################
+import time
+import unittest
+
+from octoprint_octolapse.render import is_rendering_template_valid, RenderJobInfo
+
+
+class TestRenderTemplates(unittest.TestCase):
+    def test_is_rendering_template_valid(self):
+        """Test that rendering file name templates are only accepted if they produce a valid file name."""
+        options = ["FAILEDFLAG", "PRINTENDTIME", "GCODEFILENAME"]
+        self.assertEqual((True, ""), is_rendering_template_valid("{GCODEFILENAME}_{PRINTENDTIME}", options))
+        self.assertTrue(is_rendering_template_valid("my timelapse {FAILEDFLAG}.v2", options)[0])
+        # characters that are not valid in a file name on some supported OS
+        for invalid_character in '<>:"/\\|?*':
+            self.assertFalse(
+                is_rendering_template_valid("{GCODEFILENAME}" + invalid_character, options)[0], invalid_character
+            )
+        # control characters, including a trailing newline
+        self.assertFalse(is_rendering_template_valid("{GCODEFILENAME}\x01", options)[0])
+        self.assertFalse(is_rendering_template_valid("{GCODEFILENAME}\n", options)[0])
+        self.assertFalse(is_rendering_template_valid("", options)[0])
+
+    def test_is_rendering_template_valid_tokens(self):
+        """Test that unknown, positional and malformed tokens are rejected."""
+        options = ["GCODEFILENAME"]
+        self.assertEqual(
+            (False, "The following token is invalid: {UNKNOWN}"), is_rendering_template_valid("{UNKNOWN}", options)
+        )
+        self.assertFalse(is_rendering_template_valid("{0}", options)[0])
+        self.assertFalse(is_rendering_template_valid("{GCODEFILENAME", options)[0])
+
+    def test_get_output_tokens_timestamps(self):
+        """Test that the timestamp tokens are hundredths of a second, rounded, and format into file names."""
+        tokens = RenderJobInfo.get_output_tokens(
+            print_end_time=1600000000.126, print_start_time=1500000000.004, print_end_state="COMPLETED",
+            print_file_name="test", camera_name="camera"
+        )
+        self.assertEqual("160000000013", tokens["PRINTENDTIMESTAMP"])
+        self.assertEqual("150000000000", tokens["PRINTSTARTTIMESTAMP"])
+        self.assertEqual(
+            time.strftime("%Y%m%d%H%M%S", time.localtime(1500000000.004)), tokens["PRINTSTARTTIME"]
+        )
+        self.assertEqual(
+            "test_150000000000", RenderJobInfo.get_rendering_filename("{GCODEFILENAME}_{PRINTSTARTTIMESTAMP}", tokens)
+        )
+
+    def test_get_output_tokens_unknown(self):
+        """Test the tokens when the print times are not known."""
+        tokens = RenderJobInfo.get_output_tokens()
+        self.assertEqual("UNKNOWN", tokens["PRINTSTARTTIMESTAMP"])
+        self.assertEqual("UNKNOWN", tokens["PRINTENDTIMESTAMP"])
+        self.assertEqual("UNKNOWN", tokens["PRINTSTATE"])
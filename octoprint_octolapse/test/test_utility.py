@@ -21,7 +21,10 @@
 # following email address: FormerLurker@pm.me
 ##################################################################################
 
+import os
 import unittest
+from shutil import rmtree
+from tempfile import mkdtemp
 from octoprint_octolapse._version import get_versions
 import octoprint_octolapse.utility as utility
 from octoprint_octolapse_setuptools import NumberedVersion
@@ -269,6 +272,51 @@ class TestUtility(unittest.TestCase):
                 pass
         self.assertEqual(plugin_version, fallback_version)
 
+    def test_get_collision_free_filepath(self):
+        """Test that a number is added to the file name until it no longer collides with an existing file."""
+        directory = mkdtemp()
+        try:
+            path = os.path.join(directory, "timelapse.mp4")
+            # no collision
+            self.assertEqual(path, utility.get_collision_free_filepath(path))
+            # the first free number is used
+            for file_name in ["timelapse.mp4", "timelapse_1.mp4", "timelapse_2.mp4", "timelapse_4.mp4"]:
+                open(os.path.join(directory, file_name), 'w').close()
+            self.assertEqual(os.path.join(directory, "timelapse_3.mp4"), utility.get_collision_free_filepath(path))
+            # other extensions do not collide
+            other_path = os.path.join(directory, "timelapse.avi")
+            self.assertEqual(other_path, utility.get_collision_free_filepath(other_path))
+            # the directory does not exist yet
+            missing_path = os.path.join(directory, "missing", "timelapse.mp4")
+            self.assertEqual(missing_path, utility.get_collision_free_filepath(missing_path))
+        finally:
+            rmtree(directory)
+
+    def test_rmtree_in_background(self):
+        """Test that the directory is renamed away immediately, and deleted along with any left over directories."""
+        parent_directory = mkdtemp()
+        try:
+            directory = os.path.join(parent_directory, "rendering")
+            os.makedirs(os.path.join(directory, "nested"))
+            for index in range(10):
+                open(os.path.join(directory, "{0}.jpg".format(index)), 'w').close()
+            # a directory left over from a deletion that did not finish
+            os.makedirs(os.path.join(parent_directory, "rendering.todelete.left_over", "nested"))
+            # a directory that must not be deleted
+            os.makedirs(os.path.join(parent_directory, "rendering_other"))
+
+            thread = utility.rmtree_in_background(directory)
+            # the directory is gone as soon as the function returns, so it can be created again
+            self.assertFalse(os.path.exists(directory))
+            os.makedirs(directory)
+            thread.join()
+            self.assertEqual(["rendering", "rendering_other"], sorted(os.listdir(parent_directory)))
+            # the directory must exist
+            rmtree(directory)
+            self.assertRaises(OSError, utility.rmtree_in_background, directory)
+        finally:
+            rmtree(parent_directory)
+
 if __name__ == '__main__':
     suite = unittest.TestLoader().loadTestsFromTestCase(TestUtility)
     unittest.TextTestRunner(verbosity=3).run(suite)
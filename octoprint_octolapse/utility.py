@@ -187,19 +187,26 @@ def get_collision_free_filepath(path):
     directory = get_directory_from_full_path(path)
     extension = get_extension_from_full_path(path)
 
-    original_filename = filename
-    file_number = 0
-    # Check to see if the file exists, if it does add a number to the end and continue
-    while os.path.isfile(
-        os.path.join(
-            directory,
-            "{0}.{1}".format(filename, extension)
-        )
-    ):
-        file_number += 1
-        filename = "{0}_{1}".format(original_filename, file_number)
+    # List the directory once instead of checking every candidate file name for existence.  normcase makes the
+    # comparison case insensitive on windows, like the file system.
+    try:
+        existing_names = set(os.path.normcase(name) for name in os.listdir(directory))
+    except OSError:
+        # the directory does not exist yet, so there can be no collisions
+        existing_names = set()
+
+    # Check to see if the file exists, if it does add a number to the end and continue.  Only the number changes
+    # between candidates, so build the rest of the name once.
+    suffix = ".{0}".format(extension)
+    if os.path.normcase(filename + suffix) in existing_names:
+        prefix = os.path.normcase(filename + "_")
+        normalized_suffix = os.path.normcase(suffix)
+        file_number = 1
+        while "{0}{1}{2}".format(prefix, file_number, normalized_suffix) in existing_names:
+            file_number += 1
+        filename = "{0}_{1}".format(filename, file_number)
 
-    return os.path.join(directory, "{0}.{1}".format(filename, extension))
+    return os.path.join(directory, filename + suffix)
 
 
 def greater_than_or_close(a, b, abs_tol):
@@ -399,13 +406,6 @@ def get_snapshot_filename(print_name, snapshot_number):
     return "{0}{1}.{2}".format(print_name, format_snapshot_number(snapshot_number), default_snapshot_extension)
 
 
-def get_pre_roll_snapshot_filename(print_name, snapshot_number):
-    return "{0}{1}_{2}.{3}".format(
-        print_name,
-        format_snapshot_number(snapshot_number),
-        format_snapshot_number(snapshot_number),
-        "jpg")
-
 SnaphotNumberDigits = 6
 SnapshotNumberFormat = "%0{0}d".format(SnaphotNumberDigits)
 
@@ -857,6 +857,57 @@ def move(src, dst):
                 raise e
 
 
+def rename(src, dst):
+    """Renames a file within the same file system with a single os.rename call, which avoids the extra stat and copy
+       fallback of shutil.move.  Like move, windows retries the rename if the file is still in use.  Note that
+       windows will not replace an existing dst.
+    """
+    num_tries = 0
+    while True:
+        try:
+            os.rename(src, dst)
+            break
+        except WindowsError as e:
+            if e.winerror != ERROR_WINDOWS_FILE_IS_IN_USE:
+                raise e
+            num_tries += 1
+            if num_tries < ERROR_WINDOWS_FILE_IS_IN_USE_RETRIES:
+                time.sleep(ERROR_WINDOWS_FILE_IS_IN_USE_RETRY_SECONDS)
+            else:
+                raise e
+
+
+_deleted_directory_suffix = ".todelete."
+
+
+def rmtree_in_background(path):
+    """Deletes a directory without waiting for every file to be removed.  The directory is renamed, which is a single
+       operation, and the renamed directory is deleted on a daemon thread.  Any directories left over from an
+       earlier call that did not finish (for example because the process exited) are deleted too.  Raises OSError if
+       the directory could not be renamed.
+    """
+    path = os.path.normpath(path)
+    rename(path, "{0}{1}{2}".format(path, _deleted_directory_suffix, uuid.uuid4().hex))
+    parent_directory, name = os.path.split(path)
+    prefix = name + _deleted_directory_suffix
+
+    def delete_directories():
+        try:
+            names = os.listdir(parent_directory)
+        except OSError:
+            logger.exception("Could not list the deleted directories in %s.", parent_directory)
+            return
+        for deleted_name in names:
+            if deleted_name.startswith(prefix):
+                # Anything that can't be deleted now will be deleted the next time.
+                shutil.rmtree(os.path.join(parent_directory, deleted_name), ignore_errors=True)
+
+    thread = threading.Thread(target=delete_directories)
+    thread.daemon = True
+    thread.start()
+    return thread
+
+
 class TimelapseJobInfo(object):
     timelapse_info_file_name = "timelapse_info.json"
 
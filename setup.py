@@ -51,9 +51,17 @@ plugin_url = "https://github.com/FormerLurker/Octolapse"
 plugin_license = "AGPLv3"
 
 # Any additional requirements besides OctoPrint should be listed here
-plugin_requires = ["pillow >=6.2.0<7.0.0", "sarge", "six", "OctoPrint>1.3.8", "psutil", "file_read_backwards",
+plugin_requires = ["pillow >=6.2.0<7.0.0", "six", "OctoPrint>1.3.8", "psutil", "file_read_backwards",
                    "setuptools>=6.0", "awesome-slugify>=1.6.5,<1.7"]
 
+# Pillow-SIMD is a drop in replacement for pillow that uses SSE4/AVX2, which speeds up text overlays on x86 hosts.  It
+# installs into the same PIL package, so it can't be offered as an extra (the pillow requirement above would be
+# installed next to it).  To use it, swap it in manually after installing Octolapse, using a release that matches the
+# pillow requirement (Pillow-SIMD versions track pillow versions with a .postN suffix):
+#   pip uninstall pillow
+#   pip install "Pillow-SIMD==6.2.2.post1"
+# Octolapse logs which build is in use at startup.
+
 import octoprint.server
 if LooseVersion(octoprint.server.VERSION) < LooseVersion("1.4"):
     plugin_requires.extend(["flask_principal>=0.4,<1.0"])